@@ -0,0 +1,91 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from loguru import logger
+
+# database/batch_scheduler.py is a copy for single queries, keep the two in
+# sync. database/test_shared_copies.py checks that they behave the same.
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "16"))
+# Milliseconds to wait for more requests once the first one of a batch arrived
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", "10"))
+
+BatchHandler = Callable[[List[Tuple[str, str]]], Awaitable[list]]
+
+
+class BatchScheduler:
+    """Group concurrent chat requests into micro-batches.
+
+    Requests submitted within MAX_BATCH_WAIT_MS of each other, up to
+    MAX_BATCH_SIZE, are handed together to the batch handler, which returns one
+    answer or exception per (message, session_id) request.
+    """
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_BATCH_WAIT_MS / 1000,
+    ):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._batches = set()  # Keep running batch tasks from being collected
+
+    def start(self) -> None:
+        """Start collecting requests, from within the running event loop."""
+        self.queue = asyncio.Queue()
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop collecting requests and wait for the running batches."""
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def submit(self, message: str, session_id: str) -> str:
+        """Queue a request and wait for its answer."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((message, session_id, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Answer the batch while the next one is being collected
+            task = asyncio.create_task(self._process(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _process(self, batch) -> None:
+        logger.info(f"Processing a batch of {len(batch)} chat requests")
+        try:
+            results = await self.handler(
+                [(message, session_id) for message, session_id, _ in batch]
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():  # The client went away
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,17 +1,22 @@
+import asyncio
+import hashlib
 import os
-from typing import List
+import re
+from functools import cached_property, lru_cache
+from typing import AsyncIterator, List, Optional, Tuple
 
+import httpx
 from colbert_prompt import COLBERT_PROMPT, OUTPUT_PROMPT, TOOLS_PROMPT
 from dotenv import load_dotenv
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_mistralai import ChatMistralAI, MistralAIEmbeddings
 from loguru import logger
 from pydantic import BaseModel, Field
 from redis_service import RedisService
 from search_tool import WebsiteSearchTool
+from semantic_cache import SemanticCache
+from vector_utils import collection_space
 
 load_dotenv()
 
@@ -20,13 +25,110 @@ MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 if not MISTRAL_API_KEY:
     raise ValueError("MISTRAL_API_KEY environment variable is not set")
 
+# When CHROMA_HOST is set, all workers share one Chroma server instead of each
+# loading the index from CHROMA_DB_PATH
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "chroma_db")
+
+MISTRAL_API_URL = os.getenv("MISTRAL_BASE_URL", "https://api.mistral.ai/v1")
 MISTRAL_MODELS = ["mistral-large", "mistral-medium", "mistral-small"]
+TOP_K_RETRIEVAL = 3
+TOP_N_SOURCES = 3  # Distinct source pages kept in the context
+# Chroma distance above which a chunk is too far from the query to help, for
+# each distance function of the collection. The mistral-embed vectors are unit
+# length, so all of them cut at a cosine similarity of 0.5.
+MAX_DISTANCES = {"ip": 0.5, "cosine": 0.5, "l2": 1.0}
+# Seconds to wait on a model before also trying the next one
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "8"))
+
+# One pool of keep-alive HTTP/2 connections to the Mistral API, shared by the
+# embeddings and every chat model instead of one pool per client
+_MISTRAL_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "Authorization": f"Bearer {MISTRAL_API_KEY}",
+}
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128)
+_HTTP_CLIENT = httpx.Client(
+    base_url=MISTRAL_API_URL,
+    headers=_MISTRAL_HEADERS,
+    http2=True,
+    limits=_HTTP_LIMITS,
+    timeout=120,
+)
+_ASYNC_HTTP_CLIENT = httpx.AsyncClient(
+    base_url=MISTRAL_API_URL,
+    headers=_MISTRAL_HEADERS,
+    http2=True,
+    limits=_HTTP_LIMITS,
+    timeout=120,
+)
+
+# Markdown fence, with an optional language tag, opening or closing the output
+_CODE_FENCE_RE = re.compile(r"^\s*```[\w-]*[ \t]*\n?|\n?```\s*$")
+# Questions about current events may be missing from the indexed pages. Only
+# explicit recency phrasing counts: words such as "nouveau" or a year also fit
+# routine procedures, which the retrieved pages answer.
+_WEB_SEARCH_RE = re.compile(
+    r"actualit|récemment|aujourd'hui|cette année|en ce moment",
+    re.IGNORECASE,
+)
+
+# The prompts are static, parse them once for every agent and model
+_COLBERT_CHAT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", COLBERT_PROMPT + TOOLS_PROMPT + OUTPUT_PROMPT),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ]
+)
+# Without tools, one LLM call answers from the retrieved context
+_COLBERT_DIRECT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", COLBERT_PROMPT + OUTPUT_PROMPT),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{input}"),
+    ]
+)
+# Streamed answers are free-form text, sources are appended afterwards
+_COLBERT_STREAM_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", COLBERT_PROMPT),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{input}"),
+    ]
+)
+
+SERVICE_PUBLIC_URL = "https://www.service-public.fr/particuliers/vosdroits"
+
+
+@lru_cache(maxsize=4096)
+def _build_sp_url(doc_id: str) -> str:
+    return f"{SERVICE_PUBLIC_URL}/{doc_id}"
+
+
+def _resolve_source_url(metadata: dict) -> str:
+    """Return the public URL of a chunk: its spUrl, its source, the
+    service-public.fr page built from its ID, or the service-public.fr home."""
+    source_url = metadata.get("spUrl") or metadata.get("source")
+    if source_url:
+        return source_url
+    doc_id = metadata.get("ID")
+    return _build_sp_url(doc_id) if doc_id else SERVICE_PUBLIC_URL
+
+
+class ColbertAnswer(BaseModel):
+    """Structured output of the LLM, sources are attached by the backend."""
+
+    answer: str = Field(description="The answer to the user's question")
 
 
 class ColbertResponse(BaseModel):
     answer: str = Field(description="The answer to the user's question")
     sources: List[str] = Field(
-        description="The sources used to answer the user's question, should be a list of urls"
+        description="The URLs of the retrieved pages and web search results"
     )
 
 
@@ -34,6 +136,7 @@ class ColbertAgent:
     def __init__(self):
         # Initialize Redis service
         self.redis_service = RedisService()
+        self.semantic_cache = SemanticCache(self.redis_service.redis_client)
 
         # Initialize search tool
         self.search_tool = WebsiteSearchTool()
@@ -42,126 +145,511 @@ class ColbertAgent:
         # Initialize vector store
         self.embeddings = MistralAIEmbeddings(
             model="mistral-embed",
-            api_key=MISTRAL_API_KEY
-        )
-        self.vector_store = Chroma(
-            collection_name="service_public",
-            embedding_function=self.embeddings,
-            persist_directory="chroma_db"
+            api_key=MISTRAL_API_KEY,
+            client=_HTTP_CLIENT,
+            async_client=_ASYNC_HTTP_CLIENT,
         )
+        # Imported here, chromadb and its native dependencies are slow to load
+        import chromadb
+        from langchain_community.vectorstores import Chroma
 
-        # Create the prompt template
-        self.prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", COLBERT_PROMPT),
-                ("system", TOOLS_PROMPT),
-                ("system", OUTPUT_PROMPT),
-                MessagesPlaceholder(variable_name="history"),
-                ("human", "{input}"),
-                MessagesPlaceholder(variable_name="agent_scratchpad"),
-            ]
-        )
+        if CHROMA_HOST:
+            self.vector_store = Chroma(
+                client=chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT),
+                collection_name="service_public",
+                embedding_function=self.embeddings,
+            )
+        else:
+            self.vector_store = Chroma(
+                collection_name="service_public",
+                embedding_function=self.embeddings,
+                persist_directory=CHROMA_DB_PATH,
+            )
+        # Older stores were built with L2 distance, newer ones with inner product
+        space = collection_space(self.vector_store._collection)
+        self.max_distance = MAX_DISTANCES[space]
+        logger.info(f"Keeping chunks within {space} distance {self.max_distance}")
+
+        # Build every model and its chains once, reusing their HTTP clients
+        self.llms = {model: self._build_llm(model) for model in MISTRAL_MODELS}
+        self.direct_chains = {
+            model: _COLBERT_DIRECT_PROMPT | llm.with_structured_output(ColbertAnswer)
+            for model, llm in self.llms.items()
+        }
+        self.stream_chains = {
+            model: _COLBERT_STREAM_PROMPT | llm for model, llm in self.llms.items()
+        }
 
-        # Initialize with the first model
-        self._initialize_llm(MISTRAL_MODELS[0])
+    @cached_property
+    def chains(self) -> dict:
+        """Agent chains with web search, built on first use since most
+        questions are answered by the direct chains."""
+        return {model: self._build_chain(llm) for model, llm in self.llms.items()}
 
-    def _initialize_llm(self, model_name: str):
+    @staticmethod
+    def _build_llm(model_name: str) -> ChatMistralAI:
         """Initialize the LLM with the specified model."""
-        self.llm = ChatMistralAI(
+        return ChatMistralAI(
             model=model_name,
             temperature=0.7,
             max_retries=2,
             api_key=MISTRAL_API_KEY,
+            client=_HTTP_CLIENT,
+            async_client=_ASYNC_HTTP_CLIENT,
         )
 
+    def _build_chain(self, llm: ChatMistralAI):
+        """Build the agent chain around the given LLM, the session history is
+        passed in its inputs."""
+        from langchain.agents import AgentExecutor, create_openai_tools_agent
+
         # Create the agent with tools
-        self.agent = create_openai_tools_agent(
-            llm=self.llm, tools=self.tools, prompt=self.prompt
+        agent = create_openai_tools_agent(
+            llm=llm, tools=self.tools, prompt=_COLBERT_CHAT_PROMPT
         )
 
         # Create the agent executor with proper configuration
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
+        return AgentExecutor(
+            agent=agent,
             tools=self.tools,
             verbose=True,
             handle_parsing_errors=True,
             return_intermediate_steps=True,
         )
 
-        # Chain with history
-        self.chain_with_history = RunnableWithMessageHistory(
-            self.agent_executor,
-            self.get_redis_history,
-            input_messages_key="input",
-            history_messages_key="history",
-        )
-
-    def get_redis_history(self, session_id: str):
-        history = self.redis_service.get_history(session_id)
-        logger.debug(f"History: {history}")
-        return history
-
     def _format_response(self, response: ColbertResponse) -> str:
         """Format the response with sources using markdown."""
         # Format the answer with proper spacing and line breaks
         formatted_answer = response.answer.strip()
+        return formatted_answer + self._format_sources(response.sources)
 
-        # Format sources as markdown links with prefix
-        sources_text = "\n\nSources:\n"
-        for source in response.sources:
-            sources_text += f"- [{source}]({source})\n"
+    @staticmethod
+    def _source_urls(relevant_docs) -> List[str]:
+        """Return the distinct source URLs of the retrieved chunks, best first."""
+        return list(
+            dict.fromkeys(_resolve_source_url(doc.metadata) for doc in relevant_docs)
+        )
 
-        return formatted_answer + sources_text
+    @staticmethod
+    def _web_search_urls(response: dict) -> List[str]:
+        """Return the URLs found by the web searches of an agent run."""
+        urls = []
+        for action, observation in response.get("intermediate_steps", []):
+            if action.tool == "web_search" and observation != "SEARCH_FAILED":
+                urls.extend(str(observation).splitlines())
+        return urls
 
-    def _get_relevant_documents(self, query: str, k: int = 3):
-        """Retrieve relevant documents from the vector store."""
-        docs = self.vector_store.similarity_search(query, k=k)
-        return docs
+    @staticmethod
+    def _format_sources(sources: List[str]) -> str:
+        """Format sources as markdown links with prefix."""
+        return "\n\nSources:\n" + "".join(
+            f"- [{source}]({source})\n" for source in sources
+        )
 
-    def ask_colbert(self, message: str, session_id: str) -> str:
-        # First, get relevant documents from the vector store
-        relevant_docs = self._get_relevant_documents(message)
+    @staticmethod
+    def _with_distances(docs_with_scores) -> List[Document]:
+        """Keep the query distance of each document in its metadata."""
+        for doc, distance in docs_with_scores:
+            doc.metadata["distance"] = distance
+        return [doc for doc, _ in docs_with_scores]
 
-        # Add the relevant context to the message
-        context = "\n\n".join([doc.page_content for doc in relevant_docs])
-        enhanced_message = f"{message}\n\nRelevant context:\n{context}"
+    def _get_relevant_documents_per_query(
+        self, embeddings: List[List[float]], k: int = TOP_K_RETRIEVAL
+    ) -> List[List[Document]]:
+        """Retrieve the documents of each query embedding with one Chroma query."""
+        return [
+            self._select_documents(docs_with_scores, k)
+            for docs_with_scores in self._query_collection(embeddings, k)
+        ]
 
-        for model in MISTRAL_MODELS:
+    def _query_collection(self, embeddings: List[List[float]], k: int):
+        """Search the nearest chunks of several embeddings at once, return the
+        chunks and their distances for each embedding."""
+        results = self.vector_store._collection.query(
+            query_embeddings=embeddings,
+            n_results=k * 2,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            [
+                (Document(page_content=content, metadata=metadata or {}), distance)
+                for content, metadata, distance in zip(contents, metadatas, distances)
+            ]
+            for contents, metadatas, distances in zip(
+                results["documents"], results["metadatas"], results["distances"]
+            )
+        ]
+
+    async def _aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several normalized queries, with one API call for the queries
+        whose embedding is not cached in Redis."""
+        try:
+            embeddings = await self.redis_service.aget_cached_embeddings(queries)
+        except Exception as e:
+            logger.warning(f"Failed to read cached embeddings: {str(e)}")
+            embeddings = [None] * len(queries)
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_queries = [queries[i] for i in missing]
+            new_embeddings = await self.embeddings.aembed_documents(missing_queries)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
             try:
-                logger.info(f"Attempting to use model: {model}")
-                self._initialize_llm(model)
+                await self.redis_service.acache_embeddings(
+                    missing_queries, new_embeddings
+                )
+            except Exception as e:
+                logger.warning(f"Failed to cache embeddings: {str(e)}")
+        return embeddings
+
+    def _select_documents(
+        self, docs_with_scores, k: int = TOP_K_RETRIEVAL
+    ) -> List[Document]:
+        """Keep the k best unique chunks close enough to the query, from the
+        best TOP_N_SOURCES sources only."""
+        close_docs = [
+            (doc, distance)
+            for doc, distance in docs_with_scores
+            if distance <= self.max_distance
+        ]
+        close_docs.sort(key=lambda doc_with_score: doc_with_score[1])
+        docs = self._dedupe_documents(self._with_distances(close_docs))
+
+        selected_sources = set()
+        selected_docs = []
+        for doc in docs:
+            source = _resolve_source_url(doc.metadata)
+            if source not in selected_sources:
+                if len(selected_sources) == TOP_N_SOURCES:
+                    continue
+                selected_sources.add(source)
+            selected_docs.append(doc)
+            # 2 * k candidates are searched to make up for the pruned ones
+            if len(selected_docs) == k:
+                break
+        return selected_docs
+
+    @staticmethod
+    def _dedupe_documents(docs):
+        """Drop chunks ingested several times, keeping the best ranked copy."""
+        unique_docs = {}
+        for doc in docs:
+            unique_docs.setdefault(doc.page_content, doc)
+        logger.opt(lazy=True).debug(
+            "Retrieved {} chunks, {} unique",
+            lambda: len(docs),
+            lambda: len(unique_docs),
+        )
+        return list(unique_docs.values())
+
+    async def _astore_exchange(
+        self, session_id: str, message: str, output: str
+    ) -> None:
+        """Store the user message and the assistant answer in the session history."""
+        await self.redis_service.astore_messages(
+            session_id, self._exchange_messages(message, output)
+        )
+
+    @staticmethod
+    def _exchange_messages(message: str, output: str) -> List[dict]:
+        return [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": output},
+        ]
+
+    @staticmethod
+    def _strip_code_blocks(text: str) -> str:
+        """Remove the markdown code fence the LLM sometimes wraps JSON in,
+        keeping any inline code of the answer."""
+        return _CODE_FENCE_RE.sub("", text).strip()
+
+    @staticmethod
+    def _needs_web_search(message: str, relevant_docs) -> bool:
+        """Whether the question needs the agent and its web search tool, either
+        because nothing relevant was retrieved or because it asks about news."""
+        return not relevant_docs or _WEB_SEARCH_RE.search(message) is not None
 
-                response = self.chain_with_history.invoke(
-                    {"input": enhanced_message, "session_id": session_id},
-                    config={"configurable": {"session_id": session_id}},
+    def _select_chains(self, message: str, relevant_docs, history) -> Tuple[dict, dict]:
+        """Return the chains to run for the question and their inputs."""
+        inputs = {
+            "input": self._enhance_message(message, relevant_docs),
+            "history": list(history.messages),
+        }
+        logger.opt(lazy=True).debug("History: {}", lambda: inputs["history"])
+        if self._needs_web_search(message, relevant_docs):
+            logger.info("Answering with the web search agent")
+            return self.chains, inputs
+        return self.direct_chains, inputs
+
+    def _parse_output(
+        self, response, relevant_docs
+    ) -> Tuple[Optional[ColbertResponse], str]:
+        """Parse the LLM output and attach the sources of the retrieved chunks
+        and web searches, return the structured response and its text."""
+        sources = self._source_urls(relevant_docs)
+        if isinstance(response, ColbertAnswer):
+            structured_output = ColbertResponse(answer=response.answer, sources=sources)
+            return structured_output, self._format_response(structured_output)
+        if isinstance(response, dict) and "output" in response:
+            try:
+                answer = ColbertAnswer.model_validate_json(
+                    self._strip_code_blocks(response["output"])
+                )
+                structured_output = ColbertResponse(
+                    answer=answer.answer,
+                    sources=list(
+                        dict.fromkeys(sources + self._web_search_urls(response))
+                    ),
                 )
+                return structured_output, self._format_response(structured_output)
+            except Exception as e:
+                logger.warning(f"Failed to parse structured output: {str(e)}")
+                return None, str(response["output"])
+        return None, str(response)
 
-                # Extract and parse the output
-                if isinstance(response, dict) and "output" in response:
-                    try:
-                        structured_output = ColbertResponse.model_validate_json(
-                            response["output"]
-                        )
-                        output = self._format_response(structured_output)
-                    except Exception as e:
-                        logger.warning(f"Failed to parse structured output: {str(e)}")
-                        output = str(response["output"])
-                else:
-                    output = str(response)
+    @staticmethod
+    def _format_context(relevant_docs) -> str:
+        """Join the retrieved chunks grouped by source, best sources first.
+
+        Retrieval keeps at most TOP_K_RETRIEVAL chunks, which bounds the context.
+        """
+        chunks_by_source = {}
+        for doc in sorted(relevant_docs, key=lambda d: d.metadata.get("distance", 0)):
+            source = _resolve_source_url(doc.metadata)
+            chunks_by_source.setdefault(source, []).append(doc.page_content)
+        return "\n\n".join(
+            chunk for chunks in chunks_by_source.values() for chunk in chunks
+        )
+
+    def _enhance_message(self, message: str, relevant_docs) -> str:
+        """Add the relevant context to the message."""
+        context = self._format_context(relevant_docs)
+        return f"{message}\n\nRelevant context:\n{context}"
+
+    def _cache_response(
+        self, query: str, query_embedding: List[float], response: ColbertResponse
+    ) -> None:
+        self.semantic_cache.store(
+            hashlib.sha1(query.encode()).hexdigest(),
+            query_embedding,
+            response.model_dump_json(),
+        )
 
-                logger.success(f"Response generated for message: {message}")
-                logger.success(f"Response: {output}")
+    async def _lookup_cache(
+        self, query_embedding: List[float], is_first_turn: bool
+    ) -> Optional[str]:
+        if not is_first_turn:
+            return None
+        return await asyncio.to_thread(self.semantic_cache.lookup, query_embedding)
 
-                self.redis_service.store_message(
-                    session_id, {"role": "user", "content": message}
+    async def ask_colbert_async(self, message: str, session_id: str) -> str:
+        """Answer a single request through the batch pipeline."""
+        (answer,) = await self.ask_colbert_batch([(message, session_id)])
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+    async def ask_colbert_batch(self, requests: List[Tuple[str, str]]) -> list:
+        """Answer several (message, session_id) requests together.
+
+        The queries are embedded with one API call and searched with one Chroma
+        query, then the LLM calls of the requests run concurrently. A request
+        that fails gets its exception in place of its answer.
+        """
+        try:
+            retrieved = await self._aretrieve_batch(requests)
+        except Exception as e:
+            if len(requests) == 1:
+                raise
+            # One bad message, such as one over the embedding token limit, must
+            # not fail the requests batched with it
+            logger.warning(f"Batched retrieval failed, retrying alone: {str(e)}")
+            return await asyncio.gather(
+                *(
+                    self.ask_colbert_async(message, session_id)
+                    for message, session_id in requests
+                ),
+                return_exceptions=True,
+            )
+
+        return await asyncio.gather(
+            *(
+                self._arespond(message, session_id, *request_retrieved)
+                for (message, session_id), request_retrieved in zip(
+                    requests, zip(*retrieved)
+                )
+            ),
+            return_exceptions=True,
+        )
+
+    async def _aretrieve_batch(self, requests: List[Tuple[str, str]]) -> tuple:
+        """Load the histories, embeddings, cached responses and relevant chunks
+        of several requests, each as one list in the order of the requests."""
+        queries = [message.strip().lower() for message, _ in requests]
+        histories, query_embeddings = await asyncio.gather(
+            asyncio.gather(
+                *(
+                    self.redis_service.aget_history(session_id)
+                    for _, session_id in requests
                 )
-                self.redis_service.store_message(
-                    session_id, {"role": "assistant", "content": output}
+            ),
+            self._aembed_queries(queries),
+        )
+        cached_responses, docs_per_query = await asyncio.gather(
+            asyncio.gather(
+                *(
+                    self._lookup_cache(query_embedding, not history.messages)
+                    for query_embedding, history in zip(query_embeddings, histories)
                 )
-                return output
+            ),
+            asyncio.to_thread(
+                self._get_relevant_documents_per_query, query_embeddings
+            ),
+        )
+        return histories, query_embeddings, cached_responses, docs_per_query
+
+    async def _arespond(
+        self,
+        message: str,
+        session_id: str,
+        history,
+        query_embedding: List[float],
+        cached_response: Optional[str],
+        relevant_docs,
+    ) -> str:
+        """Answer a message from its cached response or its retrieved chunks."""
+        is_first_turn = not history.messages
+        if cached_response is not None:
+            output = self._format_response(
+                ColbertResponse.model_validate_json(cached_response)
+            )
+            await self._astore_exchange(session_id, message, output)
+            return output
+
+        chains, inputs = self._select_chains(message, relevant_docs, history)
+        response = await self._ainvoke_hedged(chains, inputs)
+        structured_output, output = self._parse_output(response, relevant_docs)
+
+        logger.success(f"Response generated for message: {message}")
+        logger.success(f"Response: {output}")
+
+        if is_first_turn and structured_output is not None:
+            await asyncio.to_thread(
+                self._cache_response,
+                message.strip().lower(),
+                query_embedding,
+                structured_output,
+            )
+
+        await self._astore_exchange(session_id, message, output)
+        return output
+
+    async def _ainvoke_hedged(self, chains: dict, inputs: dict):
+        """Invoke the models' chains in order, hedging with the next when slow.
+
+        A model that fails hands over to the next one right away, and a model
+        still running after HEDGE_DELAY gets the next one raced against it.
+        The first successful response wins and the other calls are cancelled.
+        """
+        models = iter(MISTRAL_MODELS)
+        pending = {}
+
+        def launch_next_model() -> None:
+            model = next(models, None)
+            if model is None:
+                return
+            logger.info(f"Attempting to use model: {model}")
+            task = asyncio.create_task(chains[model].ainvoke(inputs))
+            pending[task] = model
+
+        launch_next_model()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=HEDGE_DELAY, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch_next_model()
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    try:
+                        response = task.result()
+                        logger.info(f"Model {model} answered first")
+                        return response
+                    except Exception as e:
+                        logger.error(f"Error with model {model}: {str(e)}")
+                        launch_next_model()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise Exception("All models failed to generate a response")
+
+    async def ask_colbert_stream(
+        self, message: str, session_id: str
+    ) -> AsyncIterator[str]:
+        """Stream the answer as it is generated, then the retrieved sources.
+
+        Like /chat, cached answers and questions needing the web search agent
+        are answered by _arespond, and sent in one piece.
+        """
+        (
+            (history,),
+            (query_embedding,),
+            (cached_response,),
+            (relevant_docs,),
+        ) = await self._aretrieve_batch([(message, session_id)])
+        if cached_response is not None or self._needs_web_search(
+            message, relevant_docs
+        ):
+            yield await self._arespond(
+                message,
+                session_id,
+                history,
+                query_embedding,
+                cached_response,
+                relevant_docs,
+            )
+            return
+
+        enhanced_message = self._enhance_message(message, relevant_docs)
+        history_messages = list(history.messages)
+
+        for model in MISTRAL_MODELS:
+            answer_parts = []
+            try:
+                logger.info(f"Attempting to stream with model: {model}")
+                async for chunk in self.stream_chains[model].astream(
+                    {"input": enhanced_message, "history": history_messages}
+                ):
+                    if chunk.content:
+                        answer_parts.append(chunk.content)
+                        yield chunk.content
+                break
 
             except Exception as e:
+                # Once tokens were sent, falling back would garble the answer
+                if answer_parts:
+                    raise
                 logger.error(f"Error with model {model}: {str(e)}")
                 continue
+        else:
+            raise Exception("All models failed to generate a response")
 
-        raise Exception("All models failed to generate a response")
+        sources = self._source_urls(relevant_docs)
+        sources_text = self._format_sources(sources) if sources else ""
+        if sources_text:
+            yield sources_text
+
+        answer = "".join(answer_parts).strip()
+        logger.success(f"Response streamed for message: {message}")
+        if not history.messages:
+            await asyncio.to_thread(
+                self._cache_response,
+                message.strip().lower(),
+                query_embedding,
+                ColbertResponse(answer=answer, sources=sources),
+            )
+        await self._astore_exchange(session_id, message, answer + sources_text)
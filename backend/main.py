@@ -1,10 +1,15 @@
 import os
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import List
 
+import orjson
+from batch_scheduler import BatchScheduler
 from colbert_agent import ColbertAgent
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from loguru import logger
 from pydantic import BaseModel
 
@@ -19,10 +24,35 @@ os.makedirs(logs_dir, exist_ok=True)
 log_file = os.path.join(logs_dir, "colbert_backend.log")
 logger.add(log_file, rotation="10 MB", retention="7 days", level="INFO")
 
+
+@lru_cache(maxsize=1)
+def get_colbert_agent() -> ColbertAgent:
+    """Build the agent once per worker, with its clients and vector store."""
+    return ColbertAgent()
+
+
+async def answer_batch(requests):
+    return await get_colbert_agent().ask_colbert_batch(requests)
+
+
+# Concurrent /chat requests share their embedding and vector search calls
+chat_scheduler = BatchScheduler(answer_batch)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_colbert_agent()
+    chat_scheduler.start()
+    yield
+    await chat_scheduler.stop()
+
+
 app = FastAPI(
     title="Colbert Backend",
     description="RAG-powered chatbot for French public administration information",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
@@ -60,9 +90,8 @@ async def root():
 async def chat(request: ChatRequest):
     try:
         logger.info(f"Processing chat request for session: {request.session_id}")
-        colbert_agent = ColbertAgent()
         # Generate response using chat history for context
-        answer = colbert_agent.ask_colbert(request.message, request.session_id)
+        answer = await chat_scheduler.submit(request.message, request.session_id)
 
         return ChatResponse(
             answer=answer,
@@ -73,8 +102,37 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    logger.info(f"Processing streamed chat request for session: {request.session_id}")
+    colbert_agent = get_colbert_agent()
+
+    async def events():
+        try:
+            async for chunk in colbert_agent.ask_colbert_stream(
+                request.message, request.session_id
+            ):
+                yield f"data: {orjson.dumps(chunk).decode()}\n\n"
+        except Exception as e:
+            logger.error(f"Error processing streamed chat request: {str(e)}")
+            yield f"event: error\ndata: {orjson.dumps(str(e)).decode()}\n\n"
+
+    # Ask nginx and other proxies to pass each event on as soon as it is sent
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
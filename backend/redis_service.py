@@ -1,10 +1,12 @@
-import json
+import hashlib
 import os
 from datetime import timedelta
-from typing import Dict
+from typing import Dict, List, Optional
 from urllib.parse import urlparse
 
+import orjson
 import redis
+import redis.asyncio
 from dotenv import load_dotenv
 from langchain_core.chat_history import InMemoryChatMessageHistory
 from loguru import logger
@@ -19,6 +21,9 @@ redis_url = urlparse(REDIS_URL)
 redis_host = redis_url.hostname
 redis_port = redis_url.port or 6379
 
+# Number of most recent messages kept per session and sent to the LLM
+MAX_HISTORY = int(os.getenv("MAX_HISTORY", "20"))
+
 class RedisService:
     def __init__(self):
         self.redis_client = redis.Redis(
@@ -27,48 +32,111 @@ class RedisService:
             db=0,
             decode_responses=True,
         )
+        self.async_redis_client = redis.asyncio.Redis(
+            host=redis_host,
+            port=redis_port,
+            db=0,
+            decode_responses=True,
+        )
         self.session_ttl = timedelta(
             hours=1
         )  # 1 hour TTL for sessions (RGPD compliance)
-        self.memories = {}  # Store InMemoryChatMessageHistory instances
+        self.embedding_ttl = timedelta(days=7)  # Embeddings are deterministic
 
+    # Histories are always read from Redis, not kept in memory, since the
+    # requests of a session can be served by different workers
     def get_history(self, session_id: str) -> InMemoryChatMessageHistory:
-        """Get a ConversationBufferMemory instance for a session"""
-        if session_id not in self.memories:
-            self.memories[session_id] = InMemoryChatMessageHistory()
-            # Load existing messages from Redis if any
-            messages = self.redis_client.lrange(f"chat:{session_id}", 0, -1)
-            for message_json in messages:
-                message = json.loads(message_json)
-                if message["role"] == "user":
-                    self.memories[session_id].add_user_message(message["content"])
-                else:
-                    self.memories[session_id].add_ai_message(message["content"])
-        return self.memories[session_id]
+        """Get the recent messages of a session"""
+        messages = self.redis_client.lrange(f"chat:{session_id}", -MAX_HISTORY, -1)
+        return self._build_history(messages)
+
+    async def aget_history(self, session_id: str) -> InMemoryChatMessageHistory:
+        """Async version of get_history, loading messages without blocking"""
+        messages = await self.async_redis_client.lrange(
+            f"chat:{session_id}", -MAX_HISTORY, -1
+        )
+        return self._build_history(messages)
+
+    @staticmethod
+    def _build_history(messages: List[str]) -> InMemoryChatMessageHistory:
+        history = InMemoryChatMessageHistory()
+        for message_json in messages:
+            message = orjson.loads(message_json)
+            if message["role"] == "user":
+                history.add_user_message(message["content"])
+            else:
+                history.add_ai_message(message["content"])
+        return history
 
     def store_message(self, session_id: str, message: Dict) -> None:
         """Store a message in the history for a session"""
-        history = self.get_history(session_id)
-
-        if message["role"] == "user":
-            history.add_user_message(message["content"])
-        else:
-            history.add_ai_message(message["content"])
-
-        # Store message in Redis
-        message_json = json.dumps(message)
-        self.redis_client.rpush(f"chat:{session_id}", message_json)
-        self.redis_client.expire(
-            f"chat:{session_id}", int(self.session_ttl.total_seconds())
+        return self.store_messages(session_id, [message])
+
+    def store_messages(self, session_id: str, messages: List[Dict]) -> None:
+        """Store several messages in the history for a session in one round-trip"""
+        # Store messages in Redis, pipelined with the trim and the TTL refresh
+        pipe = self.redis_client.pipeline()
+        self._queue_store(pipe, session_id, messages)
+        pipe.execute()
+
+    async def astore_messages(self, session_id: str, messages: List[Dict]) -> None:
+        """Async version of store_messages"""
+        pipe = self.async_redis_client.pipeline()
+        self._queue_store(pipe, session_id, messages)
+        await pipe.execute()
+
+    def _queue_store(self, pipe, session_id: str, messages: List[Dict]) -> None:
+        key = f"chat:{session_id}"
+        pipe.rpush(key, *[orjson.dumps(message) for message in messages])
+        pipe.ltrim(key, -MAX_HISTORY, -1)
+        pipe.expire(key, int(self.session_ttl.total_seconds()))
+
+    def get_cached_embedding(self, query: str) -> Optional[List[float]]:
+        """Get the embedding of a query shared by all workers, if cached"""
+        embedding_json = self.redis_client.get(self._embedding_key(query))
+        if embedding_json is None:
+            return None
+        return orjson.loads(embedding_json)
+
+    def cache_embedding(self, query: str, embedding: List[float]) -> None:
+        """Cache the embedding of a query so other workers can reuse it"""
+        self.redis_client.setex(
+            self._embedding_key(query),
+            int(self.embedding_ttl.total_seconds()),
+            orjson.dumps(embedding),
         )
 
-        return history
+    async def aget_cached_embeddings(
+        self, queries: List[str]
+    ) -> List[Optional[List[float]]]:
+        """Get the cached embeddings of several queries in one round-trip"""
+        embeddings_json = await self.async_redis_client.mget(
+            [self._embedding_key(query) for query in queries]
+        )
+        return [
+            orjson.loads(embedding_json) if embedding_json is not None else None
+            for embedding_json in embeddings_json
+        ]
+
+    async def acache_embeddings(
+        self, queries: List[str], embeddings: List[List[float]]
+    ) -> None:
+        """Cache the embeddings of several queries in one round-trip"""
+        pipe = self.async_redis_client.pipeline()
+        for query, embedding in zip(queries, embeddings):
+            pipe.setex(
+                self._embedding_key(query),
+                int(self.embedding_ttl.total_seconds()),
+                orjson.dumps(embedding),
+            )
+        await pipe.execute()
+
+    @staticmethod
+    def _embedding_key(query: str) -> str:
+        return f"emb:{hashlib.sha1(query.encode()).hexdigest()}"
 
     def clear_history(self, session_id: str) -> None:
         """Clear history for a session"""
-        if session_id in self.memories:
-            self.memories[session_id].clear()
-        # Clear from Redis as well
         self.redis_client.delete(f"chat:{session_id}")
 
 
@@ -1,11 +1,21 @@
+import threading
 from typing import List, Optional
+from urllib.parse import urlparse
 
+from cachetools import TTLCache
 from langchain.tools import Tool
 from langchain.tools.tavily_search import TavilySearchResults
 from loguru import logger
 
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 3600  # Seconds before a query is searched again
+
 
 class WebsiteSearchTool:
+    # Shared by all instances, repeated questions skip the Tavily call
+    _cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+    _cache_lock = threading.Lock()
+
     def __init__(self, preferred_websites: Optional[List[str]] = None):
         self.preferred_websites = preferred_websites or [
             "service-public.fr",
@@ -13,6 +23,11 @@ class WebsiteSearchTool:
             "ants.gouv.fr",
             "info.gouv.fr",
         ]
+        # Hostnames are matched by suffix, in as many set lookups as they have
+        # labels whatever the number of preferred websites
+        self._preferred_hosts = frozenset(
+            website.lower() for website in self.preferred_websites
+        )
         self.search = TavilySearchResults(
             max_results=5,
             include_domains=self.preferred_websites,
@@ -20,25 +35,71 @@ class WebsiteSearchTool:
 
     def search_web(self, query: str) -> str:
         """Search the web and return the most relevant results from preferred websites."""
+        cache_key = self._cache_key(query)
+        cached_urls = self._get_cached(cache_key)
+        if cached_urls is not None:
+            return cached_urls
+
         try:
             results = self.search.run(query)
+            return self._extract_urls(results, cache_key)
+        except Exception as e:
+            logger.error(f"Error during web search: {str(e)}")
+            return "SEARCH_FAILED"
+
+    async def asearch_web(self, query: str) -> str:
+        """Async version of search_web, for agents invoked with ainvoke."""
+        cache_key = self._cache_key(query)
+        cached_urls = self._get_cached(cache_key)
+        if cached_urls is not None:
+            return cached_urls
 
-            if not results:
-                logger.warning("No results found")
-                return "SEARCH_FAILED"
+        try:
+            results = await self.search.arun(query)
+            return self._extract_urls(results, cache_key)
+        except Exception as e:
+            logger.error(f"Error during web search: {str(e)}")
+            return "SEARCH_FAILED"
 
-            # Extract URLs from results
-            urls = [result.get("url", "") for result in results if result.get("url")]
+    def _cache_key(self, query: str) -> tuple:
+        return query.strip().lower(), tuple(self.preferred_websites)
 
-            if urls:
-                logger.info(f"Found {len(urls)} URLs: {urls}")
-                return "\n".join(urls)
+    def _get_cached(self, cache_key: tuple) -> Optional[str]:
+        with self._cache_lock:
+            cached_urls = self._cache.get(cache_key)
+        if cached_urls is not None:
+            logger.info(f"Search cache hit for: {cache_key[0]}")
+        return cached_urls
 
+    def _extract_urls(self, results, cache_key: tuple) -> str:
+        """Return the result URLs one per line, caching them, or SEARCH_FAILED."""
+        if not results:
+            logger.warning("No results found")
             return "SEARCH_FAILED"
 
-        except Exception as e:
-            logger.error(f"Error during web search: {str(e)}")
-            return "SEARCH_FAILED"
+        # Extract URLs from results, from the preferred websites when any
+        urls = [result.get("url", "") for result in results if result.get("url")]
+        urls = self._filter_urls(urls)
+
+        if urls:
+            logger.info(f"Found {len(urls)} URLs: {urls}")
+            found_urls = "\n".join(urls)
+            with self._cache_lock:
+                self._cache[cache_key] = found_urls
+            return found_urls
+
+        return "SEARCH_FAILED"
+
+    def _filter_urls(self, urls: List[str]) -> List[str]:
+        """Keep the URLs of the preferred websites, or all of them if none is."""
+        return [url for url in urls if self._is_preferred(url)] or urls
+
+    def _is_preferred(self, url: str) -> bool:
+        """Whether the URL is on a preferred website or one of its subdomains."""
+        labels = (urlparse(url).hostname or "").split(".")
+        return any(
+            ".".join(labels[i:]) in self._preferred_hosts for i in range(len(labels))
+        )
 
     def get_tool(self) -> Tool:
         """Return the search tool for use in the agent."""
@@ -49,4 +110,5 @@ class WebsiteSearchTool:
             but include a disclaimer that the information should be verified as it comes from your training data
             and not from current official sources. DO NOT include any source URLs when the search fails.""",
             func=self.search_web,
+            coroutine=self.asearch_web,
         )
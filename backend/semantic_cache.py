@@ -0,0 +1,126 @@
+import struct
+from datetime import timedelta
+from typing import List, Optional
+
+import redis
+from loguru import logger
+from redis.commands.search.field import VectorField
+from redis.commands.search.query import Query
+
+try:
+    from redis.commands.search.index_definition import IndexDefinition, IndexType
+except ImportError:  # redis-py < 6
+    from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+
+EMBEDDING_DIM = 1024  # mistral-embed output size
+SIMILARITY_THRESHOLD = 0.95  # Minimum cosine similarity for a cache hit
+INDEX_NAME = "idx:answers"
+KEY_PREFIX = "answer:"
+
+
+class SemanticCache:
+    """Redis vector index of answered questions, looked up by query embedding.
+
+    Requires the RediSearch module (Redis Stack). When it is missing, the cache
+    disables itself and every lookup is a miss.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl: timedelta = timedelta(hours=24),
+    ):
+        self.redis_client = redis_client
+        self.max_distance = 1 - threshold
+        self.ttl = ttl
+        self.enabled = self._ensure_index()
+
+    def _ensure_index(self) -> bool:
+        """Create the vector index if needed, return whether the cache is usable."""
+        index = self.redis_client.ft(INDEX_NAME)
+        try:
+            index.info()
+            return True
+        except redis.ResponseError:
+            pass  # The index does not exist yet
+        except redis.RedisError as e:
+            logger.warning(f"Semantic cache disabled: {str(e)}")
+            return False
+
+        try:
+            # The response is stored in the hash and returned, not indexed
+            index.create_index(
+                [
+                    VectorField(
+                        "embedding",
+                        "FLAT",
+                        {
+                            "TYPE": "FLOAT32",
+                            "DIM": EMBEDDING_DIM,
+                            "DISTANCE_METRIC": "COSINE",
+                        },
+                    ),
+                ],
+                definition=IndexDefinition(
+                    prefix=[KEY_PREFIX], index_type=IndexType.HASH
+                ),
+            )
+            logger.info(f"Created semantic cache index {INDEX_NAME}")
+            return True
+        except redis.ResponseError as e:
+            # Another worker created it since the info() check
+            if "already exists" in str(e).lower():
+                return True
+            logger.warning(f"Semantic cache disabled: {str(e)}")
+            return False
+        except redis.RedisError as e:
+            logger.warning(f"Semantic cache disabled: {str(e)}")
+            return False
+
+    @staticmethod
+    def _to_blob(embedding: List[float]) -> bytes:
+        return struct.pack(f"{len(embedding)}f", *embedding)
+
+    def lookup(self, embedding: List[float]) -> Optional[str]:
+        """Return the cached response of the closest question, if close enough."""
+        if not self.enabled:
+            return None
+
+        query = (
+            Query("*=>[KNN 1 @embedding $vec AS distance]")
+            .return_fields("response", "distance")
+            .dialect(2)
+        )
+        try:
+            result = self.redis_client.ft(INDEX_NAME).search(
+                query, query_params={"vec": self._to_blob(embedding)}
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Semantic cache lookup failed: {str(e)}")
+            return None
+
+        if not result.docs:
+            return None
+        best = result.docs[0]
+        if float(best.distance) > self.max_distance:
+            return None
+        logger.info(f"Semantic cache hit (distance={float(best.distance):.4f})")
+        return best.response
+
+    def store(self, key: str, embedding: List[float], response: str) -> None:
+        """Store a response under the embedding of the question it answers."""
+        if not self.enabled:
+            return
+
+        cache_key = f"{KEY_PREFIX}{key}"
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hset(
+                cache_key,
+                mapping={"embedding": self._to_blob(embedding), "response": response},
+            )
+            pipe.expire(cache_key, int(self.ttl.total_seconds()))
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Semantic cache store failed: {str(e)}")
@@ -0,0 +1,10 @@
+# Copy of collection_space in database/vector_utils.py, which this separately
+# packaged backend cannot import. database/test_shared_copies.py checks that the
+# two copies behave the same.
+
+
+def collection_space(collection) -> str:
+    """Distance function of a Chroma collection, fixed when it was created."""
+    # Chroma 1.x keeps it in the configuration, older versions in the metadata
+    hnsw = (getattr(collection, "configuration", None) or {}).get("hnsw") or {}
+    return hnsw.get("space") or (collection.metadata or {}).get("hnsw:space", "l2")
@@ -0,0 +1,87 @@
+import json
+import time
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from mistralai import Mistral
+
+BATCH_REQUEST_SIZE = 64  # Texts embedded by each request of a batch job
+POLL_INTERVAL = 10  # Seconds between two batch job status checks
+FINAL_STATUSES = {"SUCCESS", "FAILED", "TIMEOUT_EXCEEDED", "CANCELLED"}
+
+
+class BatchEmbedder(Embeddings):
+    """Embed texts with one Mistral batch job instead of live API calls.
+
+    Batch jobs have higher rate limits and a lower cost but take minutes to
+    complete, which suits large evaluation corpora. When the job cannot be
+    run, the texts are embedded live by the fallback embeddings.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        fallback: Embeddings,
+        model: str = "mistral-embed",
+        poll_interval: float = POLL_INTERVAL,
+    ):
+        self.client = Mistral(api_key=api_key)
+        self.fallback = fallback
+        self.model = model
+        self.poll_interval = poll_interval
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        try:
+            return self._run_batch_job(texts)
+        except Exception as e:
+            logger.warning(f"Batch embedding failed, embedding live: {str(e)}")
+            return self.fallback.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.fallback.embed_query(text)
+
+    def _run_batch_job(self, texts: List[str]) -> List[List[float]]:
+        """Upload the texts, wait for the batch job and read its embeddings."""
+        # Each request is identified by the index of its first text
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": str(start),
+                    "body": {"input": texts[start : start + BATCH_REQUEST_SIZE]},
+                }
+            )
+            for start in range(0, len(texts), BATCH_REQUEST_SIZE)
+        ]
+        input_file = self.client.files.upload(
+            file={
+                "file_name": "embeddings.jsonl",
+                "content": "\n".join(lines).encode(),
+            },
+            purpose="batch",
+        )
+        job = self.client.batch.jobs.create(
+            input_files=[input_file.id], model=self.model, endpoint="/v1/embeddings"
+        )
+        logger.info(f"Submitted batch job {job.id} for {len(texts)} texts")
+
+        while job.status not in FINAL_STATUSES:
+            time.sleep(self.poll_interval)
+            job = self.client.batch.jobs.get(job_id=job.id)
+        if job.status != "SUCCESS" or not job.output_file:
+            raise RuntimeError(f"Batch job {job.id} ended with status {job.status}")
+
+        embeddings = [None] * len(texts)
+        output = self.client.files.download(file_id=job.output_file)
+        for line in output.read().decode().splitlines():
+            result = json.loads(line)
+            start = int(result["custom_id"])
+            for item in result["response"]["body"]["data"]:
+                embeddings[start + item["index"]] = item["embedding"]
+
+        if any(embedding is None for embedding in embeddings):
+            raise RuntimeError(f"Batch job {job.id} did not embed every text")
+        logger.info(f"Batch job {job.id} embedded {len(texts)} texts")
+        return embeddings
@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+# Copy of backend/batch_scheduler.py, which this separately packaged project
+# cannot import. Keep the two in sync: only the queued requests differ, single
+# queries here instead of (message, session_id) pairs. test_shared_copies.py
+# checks that the two behave the same.
+
+MAX_BATCH_SIZE = 32
+# Milliseconds to wait for more queries once the first one of a batch arrived
+MAX_BATCH_WAIT_MS = 5
+
+BatchHandler = Callable[[List[str]], Awaitable[List[Any]]]
+
+
+class BatchScheduler:
+    """Group concurrent queries into micro-batches.
+
+    Queries submitted within MAX_BATCH_WAIT_MS of each other, up to
+    MAX_BATCH_SIZE, are handed together to the batch handler, which returns one
+    result or exception per query.
+    """
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_BATCH_WAIT_MS / 1000,
+    ):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._batches = set()  # Keep running batch tasks from being collected
+
+    def start(self) -> None:
+        """Start collecting queries, from within the running event loop."""
+        self.queue = asyncio.Queue()
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop collecting queries and wait for the running batches."""
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def submit(self, query: str) -> Any:
+        """Queue a query and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Handle the batch while the next one is being collected
+            task = asyncio.create_task(self._process(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _process(self, batch) -> None:
+        try:
+            results = await self.handler([query for query, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():  # The caller went away
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
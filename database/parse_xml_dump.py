@@ -1,15 +1,20 @@
+import asyncio
 import logging
 import os
-import xml.etree.ElementTree as ET
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
+import httpx
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_mistralai import MistralAIEmbeddings
+from lxml import etree
 from tqdm import tqdm
+from vector_utils import collection_space, normalize_embeddings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,8 +24,111 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # Constants
+MISTRAL_API_URL = "https://api.mistral.ai/v1"
 BATCH_SIZE = 100  # Number of documents to process in each batch
-MAX_WORKERS = 8  # Number of parallel workers for XML processing
+MAX_WORKERS = os.cpu_count() or 1  # Number of processes parsing XML files
+QUEUE_SIZE = 8  # Batches parsed ahead of the vector store writes
+MAX_PENDING_FILES = MAX_WORKERS * 2  # Files submitted to the parsing processes
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SNIPPET_LENGTH = 200  # Chunk preview stored in the metadata
+HNSW_SEARCH_EF = 24  # HNSW candidates explored per query, enough for small k
+DC_PREFIX = "{http://purl.org/dc/elements/1.1/}"  # Dublin Core metadata tags
+METADATA_ATTRIBUTES = frozenset(["ID", "type", "spUrl", "dateCreation", "dateMaj"])
+
+# Keep-alive HTTP/2 connections to the Mistral API, reused by every batch
+_HTTP_CLIENT = httpx.Client(
+    base_url=MISTRAL_API_URL,
+    headers={
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "Authorization": f"Bearer {os.getenv('MISTRAL_API_KEY')}",
+    },
+    http2=True,
+    limits=httpx.Limits(
+        max_keepalive_connections=40, max_connections=100, keepalive_expiry=30
+    ),
+    timeout=120,
+)
+
+# XML files are parsed and split in worker processes, each building its own
+# text splitter once in init_worker
+_text_splitter = None
+
+
+def init_worker() -> None:
+    """Build the text splitter of a parsing process."""
+    global _text_splitter
+    _text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len,
+    )
+
+
+def extract_content(root: etree._Element) -> Tuple[str, Dict[str, Any]]:
+    """Extract text content and metadata from an XML tree."""
+    # itertext keeps the tails of comments and processing instructions, which
+    # an element walk would drop
+    content = " ".join(text.strip() for text in root.itertext() if text.strip())
+
+    # Extract Dublin Core metadata
+    metadata = {
+        element.tag[len(DC_PREFIX) :]: element.text
+        for element in root.iter(f"{DC_PREFIX}*")
+    }
+
+    # Extract other important attributes
+    for attr in METADATA_ATTRIBUTES.intersection(root.attrib.keys()):
+        metadata[attr] = root.attrib[attr]
+
+    return content, metadata
+
+
+def process_xml_file(file_path: Path) -> List[Dict[str, Any]]:
+    """Process a single XML file and return chunks with metadata."""
+    try:
+        # Each file holds one publication, parsed and walked by lxml in C
+        root = etree.parse(str(file_path)).getroot()
+
+        content, metadata = extract_content(root)
+
+        # Skip if content is empty
+        if not content.strip():
+            logger.warning(f"Skipping {file_path}: Empty content")
+            return []
+
+        # Add file information to metadata
+        metadata["source_file"] = str(file_path)
+
+        # Split content into chunks
+        chunks = _text_splitter.split_text(content)
+
+        # Skip if no chunks were created
+        if not chunks:
+            logger.warning(f"Skipping {file_path}: No chunks created")
+            return []
+
+        # Create documents with metadata, skipping empty chunks
+        base_metadata = {**metadata, "total_chunks": len(chunks)}
+        documents = [
+            {
+                "content": chunk,
+                "metadata": {
+                    **base_metadata,
+                    "chunk_id": i,
+                    "snippet": chunk[:SNIPPET_LENGTH],
+                },
+            }
+            for i, chunk in enumerate(chunks)
+            if chunk.strip()
+        ]
+
+        return documents
+
+    except Exception as e:
+        logger.error(f"Error processing {file_path}: {str(e)}")
+        return []
 
 
 class XMLParser:
@@ -38,15 +146,11 @@ class XMLParser:
 
         logger.info(f"Found {len(xml_files)} XML files in {self.data_dir}")
 
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-
         # Initialize embeddings
         self.embeddings = MistralAIEmbeddings(
-            model="mistral-embed", api_key=os.getenv("MISTRAL_API_KEY")
+            model="mistral-embed",
+            api_key=os.getenv("MISTRAL_API_KEY"),
+            client=_HTTP_CLIENT,
         )
 
         # Create chroma_db directory if it doesn't exist
@@ -58,86 +162,18 @@ class XMLParser:
             collection_name="service_public",
             embedding_function=self.embeddings,
             persist_directory=str(persist_dir),
+            # Embeddings are normalized before being added, so the inner
+            # product ranks chunks by cosine similarity
+            collection_metadata={"hnsw:space": "ip", "hnsw:search_ef": HNSW_SEARCH_EF},
         )
 
-    def extract_text_content(self, element: ET.Element) -> str:
-        """Extract text content from XML element and its children."""
-        text_parts = []
-
-        # Extract text from the current element
-        if element.text and element.text.strip():
-            text_parts.append(element.text.strip())
-
-        # Process child elements
-        for child in element:
-            if child.text and child.text.strip():
-                text_parts.append(child.text.strip())
-            text_parts.extend(self.extract_text_content(child))
-
-        return " ".join(text_parts)
-
-    def extract_metadata(self, element: ET.Element) -> Dict[str, Any]:
-        """Extract metadata from XML element."""
-        metadata = {}
-
-        # Extract Dublin Core metadata
-        for dc_elem in element.findall(".//{http://purl.org/dc/elements/1.1/}*"):
-            tag = dc_elem.tag.split("}")[-1]
-            metadata[tag] = dc_elem.text
-
-        # Extract other important attributes
-        for attr in element.attrib:
-            if attr in ["ID", "type", "spUrl", "dateCreation", "dateMaj"]:
-                metadata[attr] = element.attrib[attr]
-
-        return metadata
-
-    def process_xml_file(self, file_path: Path) -> List[Dict[str, Any]]:
-        """Process a single XML file and return chunks with metadata."""
-        try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-
-            # Extract main content
-            content = self.extract_text_content(root)
-            metadata = self.extract_metadata(root)
-
-            # Skip if content is empty
-            if not content.strip():
-                logger.warning(f"Skipping {file_path}: Empty content")
-                return []
-
-            # Add file information to metadata
-            metadata["source_file"] = str(file_path)
-
-            # Split content into chunks
-            chunks = self.text_splitter.split_text(content)
-
-            # Skip if no chunks were created
-            if not chunks:
-                logger.warning(f"Skipping {file_path}: No chunks created")
-                return []
-
-            # Create documents with metadata
-            documents = []
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip():  # Skip empty chunks
-                    continue
-                doc = {
-                    "content": chunk,
-                    "metadata": {
-                        **metadata,
-                        "chunk_id": i,
-                        "total_chunks": len(chunks),
-                    },
-                }
-                documents.append(doc)
-
-            return documents
-
-        except Exception as e:
-            logger.error(f"Error processing {file_path}: {str(e)}")
-            return []
+        # The metadata only applies to new collections, older ones keep L2
+        space = collection_space(self.vector_store._collection)
+        if space != "ip":
+            raise ValueError(
+                f"The service_public collection uses {space} distance, delete "
+                f"{persist_dir} to rebuild the collection with inner product"
+            )
 
     def process_batch(self, batch: List[Dict[str, Any]]) -> None:
         """Process a batch of documents and add them to the vector store."""
@@ -148,45 +184,88 @@ class XMLParser:
         metadatas = [doc["metadata"] for doc in batch]
 
         try:
-            self.vector_store.add_texts(texts=texts, metadatas=metadatas)
+            embeddings = normalize_embeddings(self.embeddings.embed_documents(texts))
+            self.vector_store._collection.add(
+                ids=[str(uuid.uuid4()) for _ in texts],
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=metadatas,
+            )
             logger.debug(f"Added batch of {len(texts)} documents to vector store")
         except Exception as e:
             logger.error(f"Error adding batch to vector store: {str(e)}")
 
+    async def produce_batches(
+        self, xml_files: List[Path], queue: asyncio.Queue
+    ) -> None:
+        """Parse XML files in parallel processes and queue their chunks in batches."""
+        loop = asyncio.get_running_loop()
+        batch = []
+
+        # Parsing is CPU-bound, it runs in processes while batches are written.
+        # At most MAX_PENDING_FILES files are in flight, the next one is only
+        # submitted once the chunks of a parsed file are queued, so a slow
+        # consumer also holds back the parsing.
+        files = iter(xml_files)
+        with (
+            ProcessPoolExecutor(
+                max_workers=MAX_WORKERS, initializer=init_worker
+            ) as executor,
+            tqdm(total=len(xml_files), desc="Processing XML files") as progress,
+        ):
+            pending = {
+                loop.run_in_executor(executor, process_xml_file, file_path)
+                for file_path in islice(files, MAX_PENDING_FILES)
+            }
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    progress.update()
+                    try:
+                        batch.extend(future.result())
+                    except Exception as e:
+                        logger.error(f"Error processing XML file: {str(e)}")
+
+                    while len(batch) >= BATCH_SIZE:
+                        await queue.put(batch[:BATCH_SIZE])
+                        batch = batch[BATCH_SIZE:]
+
+                    for file_path in islice(files, 1):
+                        pending.add(
+                            loop.run_in_executor(executor, process_xml_file, file_path)
+                        )
+
+        if batch:
+            await queue.put(batch)
+        await queue.put(None)  # No more batches
+
+    async def consume_batches(self, queue: asyncio.Queue) -> int:
+        """Add queued batches to the vector store, return the number of chunks."""
+        total = 0
+        while (batch := await queue.get()) is not None:
+            # Embedding and writing are network-bound, run them off the event loop
+            await asyncio.to_thread(self.process_batch, batch)
+            total += len(batch)
+            logger.info(f"Added {total} chunks to the vector store")
+        return total
+
+    async def run_pipeline(self, xml_files: List[Path]) -> int:
+        """Overlap XML parsing with embedding through a bounded queue."""
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        _, total = await asyncio.gather(
+            self.produce_batches(xml_files, queue), self.consume_batches(queue)
+        )
+        return total
+
     def process_directory(self):
         """Process all XML files in the data directory."""
         xml_files = list(self.data_dir.rglob("*.xml"))
         logger.info(f"Found {len(xml_files)} XML files to process")
 
-        # Process XML files in parallel
-        all_documents = []
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_file = {
-                executor.submit(self.process_xml_file, file_path): file_path
-                for file_path in xml_files
-            }
-
-            for future in tqdm(
-                as_completed(future_to_file),
-                total=len(xml_files),
-                desc="Processing XML files",
-            ):
-                file_path = future_to_file[future]
-                try:
-                    documents = future.result()
-                    all_documents.extend(documents)
-                except Exception as e:
-                    logger.error(f"Error processing {file_path}: {str(e)}")
-
-        logger.info(f"Processed {len(all_documents)} total chunks")
-
-        # Process documents in batches
-        for i in tqdm(
-            range(0, len(all_documents), BATCH_SIZE), desc="Adding to vector store"
-        ):
-            batch = all_documents[i: i + BATCH_SIZE]
-            self.process_batch(batch)
-            logger.info(f"Processed batch {i//BATCH_SIZE + 1}/{(len(all_documents)-1)//BATCH_SIZE + 1}")
+        total = asyncio.run(self.run_pipeline(xml_files))
+        logger.info(f"Processed {total} total chunks")
 
         # Verify the documents were added
         count = self.vector_store._collection.count()
@@ -1,7 +1,8 @@
+import asyncio
 import os
-import time
 import xml.etree.ElementTree as ET
-from hashlib import md5
+from hashlib import blake2b
+from itertools import chain
 from pathlib import Path
 from typing import Any, Dict, List
 
@@ -17,13 +18,13 @@ from tqdm import tqdm
 load_dotenv()
 
 # Constants
-EMBEDDING_BATCH_SIZE = 10  # Batch size for embedding API calls
+EMBEDDING_BATCH_SIZE = 25  # Texts per embedding request
+EMBEDDING_CONCURRENCY = 4  # Embedding requests in flight, within rate limits
 PROCESSING_BATCH_SIZE = 100  # Increased batch size for processing documents
 MAX_WORKERS = 1  # Fewer workers to reduce concurrent API calls
 MAX_DOCUMENTS = 2  # Process fewer documents for debugging
 CHUNK_SIZE = 1000  # Larger chunks to reduce total number of documents
 CHUNK_OVERLAP = 100  # Smaller overlap
-BATCH_DELAY = 2  # Delay between batches in seconds
 MAX_RETRIES = 3  # Maximum number of retries for rate-limited requests
 
 
@@ -74,19 +75,7 @@ class XMLParserDebug:
 
     def extract_text_content(self, element: ET.Element) -> str:
         """Extract text content from XML element and its children."""
-        text_parts = []
-
-        # Extract text from the current element
-        if element.text and element.text.strip():
-            text_parts.append(element.text.strip())
-
-        # Process child elements
-        for child in element:
-            if child.text and child.text.strip():
-                text_parts.append(child.text.strip())
-            text_parts.extend(self.extract_text_content(child))
-
-        return " ".join(text_parts)
+        return " ".join(text.strip() for text in element.itertext() if text.strip())
 
     def extract_metadata(self, element: ET.Element) -> Dict[str, Any]:
         """Extract metadata from XML element."""
@@ -132,20 +121,13 @@ class XMLParserDebug:
                 logger.warning(f"Skipping {file_path}: No chunks created")
                 return []
 
-            # Create documents with metadata
-            documents = []
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip():  # Skip empty chunks
-                    continue
-                doc = {
-                    "content": chunk,
-                    "metadata": {
-                        **metadata,
-                        "chunk_id": i,
-                        "total_chunks": len(chunks),
-                    },
-                }
-                documents.append(doc)
+            # Create documents with metadata, skipping empty chunks
+            base_metadata = {**metadata, "total_chunks": len(chunks)}
+            documents = [
+                {"content": chunk, "metadata": {**base_metadata, "chunk_id": i}}
+                for i, chunk in enumerate(chunks)
+                if chunk.strip()
+            ]
 
             logger.success(
                 f"Successfully processed {file_path} into {len(documents)} documents"
@@ -162,11 +144,11 @@ class XMLParserDebug:
         max_tries=MAX_RETRIES,
         giveup=lambda e: "429" not in str(e),
     )
-    def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    async def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """Get embeddings for a batch of texts with retry logic."""
         try:
             logger.debug(f"Getting embeddings for batch of {len(texts)} texts")
-            embeddings = self.embeddings.embed_documents(texts)
+            embeddings = await self.embeddings.aembed_documents(texts)
             logger.success(f"Successfully got embeddings for {len(embeddings)} texts")
             return embeddings
         except Exception as e:
@@ -178,33 +160,49 @@ class XMLParserDebug:
             logger.error(f"Error getting embeddings: {str(e)}")
             raise
 
-    def process_batch(self, batch: List[Dict[str, Any]]) -> None:
-        """Process a batch of documents by getting embeddings in larger batches."""
+    async def process_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Process a batch of documents, embedding its sub-batches concurrently."""
         if not batch:
             return
 
-        # Split the batch into smaller groups for embedding
         texts = [doc["content"] for doc in batch]
         metadatas = [doc["metadata"] for doc in batch]
         
         # Generate unique IDs for each document
-        hash_ids = [md5(text.encode()).hexdigest() for text in texts]
+        hash_ids = [
+            blake2b(text.encode(), digest_size=16).hexdigest() for text in texts
+        ]
         ids = [f"doc_{i}_{hash_id}" for i, hash_id in enumerate(hash_ids)]
 
-        # Process all embeddings in one batch if possible, otherwise in chunks
-        all_embeddings = []
-        logger.info(f"Processing {len(texts)} texts in {len(texts) // EMBEDDING_BATCH_SIZE} batches")
-        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
-            batch_texts = texts[i : i + EMBEDDING_BATCH_SIZE]
-            try:
-                batch_embeddings = self.get_embeddings_batch(batch_texts)
-                all_embeddings.extend(batch_embeddings)
-                logger.success(f"Successfully got embeddings for {len(batch_embeddings)} texts")
-                if i + EMBEDDING_BATCH_SIZE < len(texts):  # Only sleep if there are more batches
-                    time.sleep(BATCH_DELAY)
-            except Exception as e:
-                logger.error(f"Failed to get embeddings for batch: {str(e)}")
-                raise
+        # Embed each distinct text once, boilerplate repeats across files
+        unique_texts = {}
+        for hash_id, text in zip(hash_ids, texts):
+            unique_texts.setdefault(hash_id, text)
+        texts_to_embed = list(unique_texts.values())
+
+        # Overlap the embedding requests, rate limits are retried with backoff
+        semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+        async def embed(sub_batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self.get_embeddings_batch(sub_batch)
+
+        logger.info(f"Processing {len(texts)} texts, {len(unique_texts)} unique")
+        try:
+            sub_batches = [
+                texts_to_embed[i : i + EMBEDDING_BATCH_SIZE]
+                for i in range(0, len(texts_to_embed), EMBEDDING_BATCH_SIZE)
+            ]
+            embeddings_per_batch = await asyncio.gather(
+                *(embed(sub_batch) for sub_batch in sub_batches)
+            )
+            embeddings_by_hash = dict(
+                zip(unique_texts, chain.from_iterable(embeddings_per_batch))
+            )
+            all_embeddings = [embeddings_by_hash[hash_id] for hash_id in hash_ids]
+        except Exception as e:
+            logger.error(f"Failed to get embeddings for batch: {str(e)}")
+            raise
 
         try:
             # Add all documents to vector store in one batch
@@ -217,15 +215,30 @@ class XMLParserDebug:
                 documents=texts,
                 metadatas=metadatas
             )
-
-            # Verify the batch was added
-            current_count = self.vector_store._collection.count()
-            logger.info(f"Current document count after batch: {current_count}")
-
+            # The document count is only checked once, in process_directory
         except Exception as e:
             logger.error(f"Error adding batch to vector store: {str(e)}")
             raise
 
+    async def add_documents(self, all_documents: List[Dict[str, Any]]) -> None:
+        """Embed and add the documents to the vector store, batch by batch."""
+        # Process documents in larger batches
+        for i in tqdm(
+            range(0, len(all_documents), PROCESSING_BATCH_SIZE),
+            desc="Adding to vector store",
+        ):
+            batch = all_documents[i : i + PROCESSING_BATCH_SIZE]
+            try:
+                await self.process_batch(batch)
+                logger.info(
+                    f"Processed batch {i // PROCESSING_BATCH_SIZE + 1}/{(len(all_documents) - 1) // PROCESSING_BATCH_SIZE + 1}"
+                )
+            except Exception as e:
+                logger.error(
+                    f"Failed to process batch after {MAX_RETRIES} retries: {str(e)}"
+                )
+                continue
+
     def process_directory(self):
         """Process a limited number of XML files in the data directory."""
         xml_files = list(self.data_dir.rglob("*.xml"))[:MAX_DOCUMENTS]
@@ -242,22 +255,7 @@ class XMLParserDebug:
 
         logger.info(f"Processed {len(all_documents)} total chunks")
 
-        # Process documents in larger batches
-        for i in tqdm(
-            range(0, len(all_documents), PROCESSING_BATCH_SIZE),
-            desc="Adding to vector store",
-        ):
-            batch = all_documents[i : i + PROCESSING_BATCH_SIZE]
-            try:
-                self.process_batch(batch)
-                logger.info(
-                    f"Processed batch {i // PROCESSING_BATCH_SIZE + 1}/{(len(all_documents) - 1) // PROCESSING_BATCH_SIZE + 1}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to process batch after {MAX_RETRIES} retries: {str(e)}"
-                )
-                continue
+        asyncio.run(self.add_documents(all_documents))
 
         # Final verification
         final_doc_count = self.vector_store._collection.count()
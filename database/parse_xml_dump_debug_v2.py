@@ -73,24 +73,8 @@ class XMLParserDebugV2:
         logger.info(f"Initial document count in vector store: {self.initial_doc_count}")
 
     def extract_text_content(self, element: ET.Element) -> str:
-        """Extract text content from XML element and its children without duplication."""
-        # Get direct text content of the element
-        text_parts = []
-        if element.text and element.text.strip():
-            text_parts.append(element.text.strip())
-
-        # Process child elements
-        for child in element:
-            # Get text from child element
-            child_text = self.extract_text_content(child)
-            if child_text:
-                text_parts.append(child_text)
-            # Get tail text (text after the child element)
-            if child.tail and child.tail.strip():
-                text_parts.append(child.tail.strip())
-
-        # Join all text parts with a single space
-        return " ".join(text_parts)
+        """Extract text content from XML element and its children."""
+        return " ".join(text.strip() for text in element.itertext() if text.strip())
 
     def extract_metadata(self, element: ET.Element) -> Dict[str, Any]:
         """Extract metadata from XML element."""
@@ -136,20 +120,13 @@ class XMLParserDebugV2:
                 logger.warning(f"Skipping {file_path}: No chunks created")
                 return []
 
-            # Create documents with metadata
-            documents = []
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip():  # Skip empty chunks
-                    continue
-                doc = {
-                    "content": chunk,
-                    "metadata": {
-                        **metadata,
-                        "chunk_id": i,
-                        "total_chunks": len(chunks),
-                    },
-                }
-                documents.append(doc)
+            # Create documents with metadata, skipping empty chunks
+            base_metadata = {**metadata, "total_chunks": len(chunks)}
+            documents = [
+                {"content": chunk, "metadata": {**base_metadata, "chunk_id": i}}
+                for i, chunk in enumerate(chunks)
+                if chunk.strip()
+            ]
             return documents
 
         except Exception as e:
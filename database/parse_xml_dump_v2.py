@@ -73,19 +73,8 @@ class XMLParserV2:
         logger.info(f"Initial document count: {self.initial_doc_count}")
 
     def extract_text_content(self, element: ET.Element) -> str:
-        """Extract text content from XML element and its children without duplication."""
-        text_parts = []
-        if element.text and element.text.strip():
-            text_parts.append(element.text.strip())
-
-        for child in element:
-            child_text = self.extract_text_content(child)
-            if child_text:
-                text_parts.append(child_text)
-            if child.tail and child.tail.strip():
-                text_parts.append(child.tail.strip())
-
-        return " ".join(text_parts)
+        """Extract text content from XML element and its children."""
+        return " ".join(text.strip() for text in element.itertext() if text.strip())
 
     def extract_metadata(self, element: ET.Element) -> Dict[str, Any]:
         """Extract metadata from XML element."""
@@ -121,19 +110,12 @@ class XMLParserV2:
             if not chunks:
                 return []
 
-            documents = []
-            for i, chunk in enumerate(chunks):
-                if not chunk.strip():
-                    continue
-                doc = {
-                    "content": chunk,
-                    "metadata": {
-                        **metadata,
-                        "chunk_id": i,
-                        "total_chunks": len(chunks),
-                    },
-                }
-                documents.append(doc)
+            base_metadata = {**metadata, "total_chunks": len(chunks)}
+            documents = [
+                {"content": chunk, "metadata": {**base_metadata, "chunk_id": i}}
+                for i, chunk in enumerate(chunks)
+                if chunk.strip()
+            ]
             return documents
 
         except Exception as e:
@@ -0,0 +1,98 @@
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from numba import njit, prange
+
+SIMILARITY_THRESHOLD = 0.97  # Minimum cosine similarity for a cache hit
+MAX_ENTRIES = 1024  # Oldest entries are overwritten beyond this size
+RERANK_CANDIDATES = 64  # Cached queries closest in Hamming distance, reranked
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def cosine_similarities(
+    matrix: np.ndarray, scales: np.ndarray, query: np.ndarray
+) -> np.ndarray:
+    """Dot products of int8 rows with a float32 query, rescaled per row."""
+    similarities = np.empty(matrix.shape[0], dtype=np.float32)
+    for i in prange(matrix.shape[0]):
+        total = np.float32(0.0)
+        for j in range(matrix.shape[1]):
+            total += matrix[i, j] * query[j]
+        similarities[i] = total * scales[i]
+    return similarities
+
+
+class SemanticCache:
+    """In-memory cache of search results, looked up by query embedding.
+
+    Embeddings must be L2-normalized by the caller. They are kept in a
+    fixed-size ring buffer, so a lookup is a single pass of a compiled kernel
+    over every cached query. Each embedding is quantized to int8 with its own
+    scale, a quarter of its float32 size.
+
+    Beyond RERANK_CANDIDATES entries, the sign bits of the embeddings are
+    compared first, and only the closest candidates in Hamming distance are
+    scored with their int8 embeddings.
+    """
+
+    def __init__(
+        self, threshold: float = SIMILARITY_THRESHOLD, max_entries: int = MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.matrix: Optional[np.ndarray] = None  # Allocated on the first store
+        self.bits: Optional[np.ndarray] = None  # Sign bits of the rows
+        self.scales = np.zeros(max_entries, dtype=np.float32)
+        self.results: List[Any] = [None] * max_entries
+        self.size = 0
+        self.position = 0  # Next slot of the ring buffer
+
+    @staticmethod
+    def _quantize(vector: np.ndarray) -> Tuple[np.ndarray, float]:
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        return np.round(vector / scale).astype(np.int8), scale
+
+    @staticmethod
+    def _pack_signs(vector: np.ndarray) -> np.ndarray:
+        """Pack the sign bits of a vector into 64-bit words."""
+        bits = np.packbits(vector > 0)
+        padded = np.zeros(-(-len(bits) // 8) * 8, dtype=np.uint8)
+        padded[: len(bits)] = bits
+        return padded.view(np.uint64)
+
+    def lookup(self, embedding: List[float]) -> Optional[Any]:
+        """Return the result of the closest cached query, if similar enough."""
+        if not self.size:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.size > RERANK_CANDIDATES:
+            # Popcount of the differing sign bits, 32x less data than float32
+            hamming = np.bitwise_count(
+                self.bits[: self.size] ^ self._pack_signs(query)
+            ).sum(axis=1, dtype=np.int32)
+            rows = np.argpartition(hamming, RERANK_CANDIDATES)[:RERANK_CANDIDATES]
+        else:
+            rows = np.arange(self.size)
+
+        # One pass over the int8 rows, without converting the matrix to float
+        similarities = cosine_similarities(self.matrix[rows], self.scales[rows], query)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return self.results[rows[best]]
+
+    def store(self, embedding: List[float], result: Any) -> None:
+        """Cache the result of a query under its embedding."""
+        if self.matrix is None:
+            self.matrix = np.zeros((self.max_entries, len(embedding)), dtype=np.int8)
+            self.bits = np.zeros(
+                (self.max_entries, (len(embedding) + 63) // 64), dtype=np.uint64
+            )
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        self.matrix[self.position], self.scales[self.position] = self._quantize(vector)
+        self.bits[self.position] = self._pack_signs(vector)
+        self.results[self.position] = result
+        self.position = (self.position + 1) % self.max_entries
+        self.size = min(self.size + 1, self.max_entries)
@@ -0,0 +1,19 @@
+from lxml import etree
+from parse_xml_dump import extract_content
+
+PUBLICATION = b"""<Publication xmlns:dc="http://purl.org/dc/elements/1.1/" ID="F1"
+    type="Fiche" other="x">
+  <dc:title>Titre</dc:title>
+  <!-- commentaire -->apres comment
+  <Texte>Un <b>gras</b> reste<?pi data?>tail pi</Texte>
+  fin
+  <dc:subject>S</dc:subject>
+</Publication>"""
+
+
+def test_extract_content():
+    content, metadata = extract_content(etree.fromstring(PUBLICATION))
+
+    # The tails of comments and processing instructions are kept, not their text
+    assert content == "Titre apres comment Un gras reste tail pi fin S"
+    assert metadata == {"title": "Titre", "subject": "S", "ID": "F1", "type": "Fiche"}
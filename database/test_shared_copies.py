@@ -0,0 +1,85 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+from types import SimpleNamespace
+
+import batch_scheduler
+import pytest
+import vector_utils
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def load_backend_module(name: str):
+    """Import a backend module by path, its name clashes with the database one."""
+    path = BACKEND_DIR / f"{name}.py"
+    if not path.exists():
+        pytest.skip(f"{path} is not checked out")
+    spec = importlib.util.spec_from_file_location(f"backend_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(
+    params=[
+        lambda: vector_utils.collection_space,
+        lambda: load_backend_module("vector_utils").collection_space,
+    ],
+    ids=["database", "backend"],
+)
+def collection_space(request):
+    return request.param()
+
+
+@pytest.mark.parametrize(
+    "collection,space",
+    [
+        (SimpleNamespace(configuration={"hnsw": {"space": "ip"}}, metadata=None), "ip"),
+        (SimpleNamespace(configuration={"hnsw": None}, metadata=None), "l2"),
+        (SimpleNamespace(metadata={"hnsw:space": "cosine"}), "cosine"),
+        (SimpleNamespace(metadata=None), "l2"),
+    ],
+)
+def test_collection_space(collection_space, collection, space):
+    assert collection_space(collection) == space
+
+
+@pytest.fixture(params=["database", "backend"])
+def scheduler_copy(request):
+    """The BatchScheduler class of a copy, with its request and its query."""
+    if request.param == "database":
+        return batch_scheduler.BatchScheduler, lambda query: (query,), lambda r: r
+    module = load_backend_module("batch_scheduler")
+    return module.BatchScheduler, lambda query: (query, "session"), lambda r: r[0]
+
+
+def test_batch_scheduler(scheduler_copy):
+    scheduler_class, to_request, to_query = scheduler_copy
+    batches = []
+
+    async def handler(requests):
+        queries = [to_query(request) for request in requests]
+        batches.append(queries)
+        return [ValueError(q) if q == "bad" else q.upper() for q in queries]
+
+    async def run():
+        scheduler = scheduler_class(handler, max_batch_size=3, max_wait=0.05)
+        scheduler.start()
+        try:
+            return await asyncio.gather(
+                *(
+                    scheduler.submit(*to_request(query))
+                    for query in ["a", "bad", "b", "c"]
+                ),
+                return_exceptions=True,
+            )
+        finally:
+            await scheduler.stop()
+
+    results = asyncio.run(run())
+
+    # Batches are cut at max_batch_size and each request only gets its result
+    assert batches == [["a", "bad", "b"], ["c"]]
+    assert results[0] == "A" and results[2:] == ["B", "C"]
+    assert isinstance(results[1], ValueError)
@@ -1,57 +1,440 @@
+import asyncio
 import os
 import random
+import sys
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+import httpx
+import numpy as np
+import pytest
+from batch_embedder import BatchEmbedder
+from batch_scheduler import BatchScheduler
 from dotenv import load_dotenv
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from langchain_mistralai import MistralAIEmbeddings
+from semantic_cache import SemanticCache
+from vector_utils import collection_space, normalize_embeddings
 
 # Load environment variables
 load_dotenv()
 
+# Read once at import, the tests are skipped when it is missing
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+MISTRAL_API_URL = "https://api.mistral.ai/v1"
+# Local stores, ignored by git
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "chroma_db")
+QDRANT_DB_PATH = os.getenv("QDRANT_DB_PATH", "qdrant_db")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings")
+# Embeddings of the queries: mistral, or infinity for a local Infinity server.
+# The vector store must have been ingested with the same model.
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS", "mistral")
+INFINITY_API_URL = os.getenv("INFINITY_API_URL", "http://localhost:7997")
+INFINITY_MODEL = os.getenv("INFINITY_MODEL", "BAAI/bge-m3")
+EMBEDDING_MODEL = (
+    INFINITY_MODEL if EMBEDDINGS_PROVIDER == "infinity" else "mistral-embed"
+)
+# Mistral query sets at least this large are embedded by a Mistral batch job
+BATCH_JOB_MIN_QUERIES = int(os.getenv("BATCH_JOB_MIN_QUERIES", "1000"))
+# Vector store searched by the tests: chroma, or qdrant for read benchmarks
+VDB_BACKEND = os.getenv("VDB_BACKEND", "chroma")
+VDB_PATH = QDRANT_DB_PATH if VDB_BACKEND == "qdrant" else CHROMA_DB_PATH
+HNSW_SEARCH_EF = 24  # HNSW candidates explored per query, enough for small k
 
-def test_vector_db():
-    # Initialize embeddings
-    embeddings = MistralAIEmbeddings(
-        model="mistral-embed", api_key=os.getenv("MISTRAL_API_KEY")
+# Keep-alive HTTP/2 connections to the Mistral API, one pool for the sync and
+# one for the async requests, reused by every request of the process
+_MISTRAL_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "Authorization": f"Bearer {MISTRAL_API_KEY}",
+}
+_HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=40, max_connections=100, keepalive_expiry=30
+)
+_HTTP_CLIENT = httpx.Client(
+    base_url=MISTRAL_API_URL,
+    headers=_MISTRAL_HEADERS,
+    http2=True,
+    limits=_HTTP_LIMITS,
+    timeout=120,
+)
+_ASYNC_HTTP_CLIENT = httpx.AsyncClient(
+    base_url=MISTRAL_API_URL,
+    headers=_MISTRAL_HEADERS,
+    http2=True,
+    limits=_HTTP_LIMITS,
+    timeout=120,
+)
+
+TEST_QUERIES = [
+    "Comment obtenir un permis de construire ?",
+    "Comment renouveler une carte d'identité ?",
+    "Comment faire une demande de RSA ?",
+]
+
+# Search benchmark batch sizes and number of results
+BENCHMARK_PARAMS = [(1, 3), (8, 3), (32, 3), (128, 3)]
+BENCHMARK_ROUNDS = 5  # Each round calls the embeddings API once
+
+# The tests need the ingested vector store and the Mistral API
+pytestmark = pytest.mark.skipif(
+    not (MISTRAL_API_KEY or EMBEDDINGS_PROVIDER == "infinity")
+    or not Path(VDB_PATH).exists(),
+    reason=f"MISTRAL_API_KEY and an ingested {VDB_PATH} are required",
+)
+
+Hit = Tuple[str, Dict[str, Any], float]  # Content, metadata and distance
+
+# Results of queries already searched, for repeated or near-identical queries
+_search_cache = SemanticCache()
+
+
+def get_random_document(collection, count: int) -> Dict[str, Any]:
+    """Fetch a random document of the collection."""
+    return collection.get(offset=random.randint(0, count - 1), limit=1)
+
+
+@lru_cache(maxsize=1)
+def get_provider_embeddings() -> Embeddings:
+    """Build the EMBEDDINGS_PROVIDER embeddings once per process."""
+    if EMBEDDINGS_PROVIDER == "infinity":
+        from langchain_community.embeddings import InfinityEmbeddings
+
+        return InfinityEmbeddings(
+            model=INFINITY_MODEL, infinity_api_url=INFINITY_API_URL
+        )
+
+    return MistralAIEmbeddings(
+        model="mistral-embed",
+        api_key=MISTRAL_API_KEY,
+        client=_HTTP_CLIENT,
+        async_client=_ASYNC_HTTP_CLIENT,
     )
 
-    # Load the existing vector store
-    vector_store = Chroma(
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> CacheBackedEmbeddings:
+    """Embeddings stored on disk, texts already embedded skip the provider."""
+    return CacheBackedEmbeddings.from_bytes_store(
+        get_provider_embeddings(),
+        LocalFileStore(EMBEDDING_CACHE_PATH),
+        namespace=EMBEDDING_MODEL,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_batch_embeddings() -> CacheBackedEmbeddings:
+    """Batch job embeddings, stored in the same cache as the live ones."""
+    return CacheBackedEmbeddings.from_bytes_store(
+        BatchEmbedder(MISTRAL_API_KEY, fallback=get_provider_embeddings()),
+        LocalFileStore(EMBEDDING_CACHE_PATH),
+        namespace=EMBEDDING_MODEL,
+    )
+
+
+def warm_page_cache(path: str) -> None:
+    """Read the store files ahead into the OS page cache, so the first searches
+    do not wait on random disk reads.
+    """
+    for file_path in Path(path).rglob("*"):
+        if not file_path.is_file():
+            continue
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                while os.read(fd, 1 << 20):  # No readahead hint, read it all
+                    pass
+        finally:
+            os.close(fd)
+
+
+@lru_cache(maxsize=1)
+def get_qdrant_client():
+    """Open the local Qdrant store once, it cannot be opened twice at a time."""
+    from qdrant_client import QdrantClient
+
+    return QdrantClient(path=QDRANT_DB_PATH)
+
+
+def count_qdrant_documents() -> int:
+    """Number of chunks in the Qdrant collection, 0 when it does not exist.
+
+    parse_xml_dump.py only ingests Chroma, the Qdrant collection has to be
+    filled separately before it can be benchmarked.
+    """
+    client = get_qdrant_client()
+    if not client.collection_exists("service_public"):
+        return 0
+    return client.count("service_public").count
+
+
+@lru_cache(maxsize=1)
+def get_vector_store() -> VectorStore:
+    """Load the existing VDB_BACKEND store once per process, not on every run."""
+    warm_page_cache(VDB_PATH)
+
+    if VDB_BACKEND == "qdrant":
+        from langchain_qdrant import QdrantVectorStore
+
+        return QdrantVectorStore(
+            client=get_qdrant_client(),
+            collection_name="service_public",
+            embedding=get_embeddings(),
+        )
+
+    return Chroma(
         collection_name="service_public",
-        embedding_function=embeddings,
-        persist_directory="chroma_db",
+        embedding_function=get_embeddings(),
+        persist_directory=CHROMA_DB_PATH,
     )
 
-    # Get collection info
-    collection = vector_store._collection
+
+def set_search_ef(collection, search_ef: int) -> None:
+    """Set how many HNSW candidates each query of the collection explores."""
+    # The hnsw:search_ef metadata is only read when the collection is created
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    if hnsw.get("ef_search") == search_ef:
+        return
+    collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+
+
+async def embed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed queries in a single request, normalized like the stored chunks."""
+    embeddings = await get_embeddings().aembed_documents(queries)
+    return normalize_embeddings(embeddings).tolist()
+
+
+def search(
+    query_embeddings: List[List[float]], k: int, with_documents: bool = False
+) -> List[List[Hit]]:
+    """Find the k closest documents of each query embedding in one Chroma call.
+
+    Unless with_documents is set, the full chunks are not read and the snippet
+    stored in their metadata at ingestion stands for their content.
+    """
+    vector_store = get_vector_store()
+    if not isinstance(vector_store, Chroma):
+        # Other stores are searched one query at a time with the LangChain API,
+        # their cosine similarities converted to distances
+        return [
+            [
+                (doc.page_content, doc.metadata, 1 - score)
+                for doc, score in vector_store.similarity_search_with_score_by_vector(
+                    embedding, k=k
+                )
+            ]
+            for embedding in query_embeddings
+        ]
+
+    include = ["metadatas", "distances"]
+    if with_documents:
+        include.append("documents")
+    results = vector_store._collection.query(
+        query_embeddings=query_embeddings, n_results=k, include=include
+    )
+
+    if with_documents:
+        contents = results["documents"]
+    else:
+        contents = [
+            [metadata.get("snippet", "") for metadata in metadatas]
+            for metadatas in results["metadatas"]
+        ]
+    return [
+        list(zip(documents, metadatas, distances))
+        for documents, metadatas, distances in zip(
+            contents, results["metadatas"], results["distances"]
+        )
+    ]
+
+
+def get_cached_hits(embedding: List[float], k: int) -> Optional[List[Hit]]:
+    """Return the top k documents of a similar cached query, if any."""
+    hits = _search_cache.lookup(embedding)
+    if hits is None or len(hits) < k:
+        return None
+    return hits[:k]
+
+
+async def search_queries(
+    queries: List[str], k: int, with_documents: bool = False
+) -> List[List[Hit]]:
+    """Embed queries in one request and search the ones missing from the cache."""
+    # Duplicate queries are embedded and searched once, then scattered back
+    unique_queries, inverse = np.unique(np.array(queries), return_inverse=True)
+    if len(unique_queries) < len(queries):
+        results = await search_queries(unique_queries.tolist(), k, with_documents)
+        return [results[i] for i in inverse]
+
+    # The embeddings are reused for both the cache lookups and the search
+    query_embeddings = await embed_queries(queries)
+
+    results = [get_cached_hits(embedding, k) for embedding in query_embeddings]
+    misses = [i for i, hits in enumerate(results) if hits is None]
+    if misses:
+        found = await asyncio.to_thread(
+            search, [query_embeddings[i] for i in misses], k, with_documents
+        )
+        for i, hits in zip(misses, found):
+            results[i] = hits
+            _search_cache.store(query_embeddings[i], hits)
+    return results
+
+
+async def stream_search(
+    queries: List[str], k: int, with_documents: bool = False
+) -> AsyncIterator[Tuple[str, List[Hit]]]:
+    """Yield each query with its hits as soon as they are found."""
+    # Queries submitted together are embedded and searched as one batch
+    scheduler = BatchScheduler(
+        partial(search_queries, k=k, with_documents=with_documents)
+    )
+
+    async def submit(query: str) -> Tuple[str, List[Hit]]:
+        return query, await scheduler.submit(query)
+
+    scheduler.start()
+    try:
+        for result in asyncio.as_completed([submit(query) for query in queries]):
+            yield await result
+    finally:
+        await scheduler.stop()
+
+
+def format_results(queries: List[str], results: List[List[Hit]]) -> str:
+    """Format the hits of every query as a single block of text."""
+    parts = []
+    for query, hits in zip(queries, results):
+        parts.append(f"\nTesting query: {query}\n\nFound similar documents:")
+        for i, (content, metadata, distance) in enumerate(hits, 1):
+            parts.append(
+                f"\n--- Document {i} (distance {distance:.4f}) ---\n"
+                f"Content: {content[:200]}...\n"  # First 200 chars
+                f"Metadata: {metadata}"
+            )
+    return "\n".join(parts)
+
+
+async def describe_collection(collection, search_ef: int) -> Optional[bool]:
+    """Print the size and a random document of a Chroma collection.
+
+    Also tunes its search. Returns whether searches must read full documents,
+    or None when the collection is empty.
+    """
     count = collection.count()
     print(f"\nTotal documents in database: {count}")
+    # Distances are 1 - cosine similarity in ip space, twice that in l2 space
+    print(f"Distance function: {collection_space(collection)}")
 
     if count == 0:
         print("No documents found in the database!")
-        return
+        return None
+
+    set_search_ef(collection, search_ef)
+
+    random_doc = await asyncio.to_thread(get_random_document, collection, count)
+    sys.stdout.write(
+        "\nRandom document from database:\n"
+        f"ID: {random_doc['ids'][0]}\n"
+        f"Content: {random_doc['documents'][0][:500]}...\n"  # First 500 chars
+        f"Metadata: {random_doc['metadatas'][0]}\n"
+    )
+
+    # Chunks ingested before snippets were stored are read in full
+    return "snippet" not in (random_doc["metadatas"][0] or {})
+
+
+async def run_queries(
+    queries: Optional[List[str]] = None,
+    k: int = 3,
+    search_ef: int = HNSW_SEARCH_EF,
+) -> Dict[str, List[Hit]]:
+    """Search every query and print its hits, return the hits of each query."""
+    queries = queries or TEST_QUERIES
+    results = {}
+
+    if VDB_BACKEND == "qdrant" and count_qdrant_documents() == 0:
+        print(f"No service_public collection to search in {QDRANT_DB_PATH}!")
+        return results
+
+    with_documents = True
+    vector_store = get_vector_store()
+    if isinstance(vector_store, Chroma):
+        with_documents = await describe_collection(vector_store._collection, search_ef)
+        if with_documents is None:
+            return results
 
-    # Get a random document
-    random_id = random.randint(0, count - 1)
-    random_doc = collection.get(ids=[collection.get()['ids'][random_id]])
-    print("\nRandom document from database:")
-    print(f"ID: {random_doc['ids'][0]}")
-    print(f"Content: {random_doc['documents'][0][:500]}...")  # First 500 chars
-    print(f"Metadata: {random_doc['metadatas'][0]}")
+    if EMBEDDINGS_PROVIDER == "mistral" and len(queries) >= BATCH_JOB_MIN_QUERIES:
+        # One batch job fills the embedding cache, the searches then skip the API
+        await asyncio.to_thread(
+            get_batch_embeddings().embed_documents, list(dict.fromkeys(queries))
+        )
 
-    # Test query
-    test_query = "Comment obtenir un permis de construire ?"
-    print(f"\nTesting query: {test_query}")
+    # One write per query, as soon as its hits are found, rather than several
+    # prints per document
+    async for query, hits in stream_search(queries, k, with_documents):
+        sys.stdout.write(format_results([query], [hits]) + "\n")
+        results[query] = hits
+    return results
 
-    # Get similar documents
-    docs = vector_store.similarity_search(test_query, k=3)
 
-    print("\nFound similar documents:")
-    for i, doc in enumerate(docs, 1):
-        print(f"\n--- Document {i} ---")
-        print(f"Content: {doc.page_content[:200]}...")  # First 200 chars
-        print(f"Metadata: {doc.metadata}")
+@pytest.fixture(scope="module")
+def vector_store() -> VectorStore:
+    if VDB_BACKEND == "qdrant" and count_qdrant_documents() == 0:
+        pytest.skip(
+            f"No service_public collection in {QDRANT_DB_PATH}, parse_xml_dump.py "
+            "only ingests Chroma"
+        )
+    vector_store = get_vector_store()
+    if isinstance(vector_store, Chroma) and vector_store._collection.count() == 0:
+        pytest.skip("No documents found in the database")
+
+    # Load the index and open the API connections before timing anything
+    vector_store.similarity_search("warmup", k=1)
+    return vector_store
+
+
+def test_vector_db(vector_store):
+    k = 3
+    results = asyncio.run(run_queries(TEST_QUERIES, k))
+
+    assert results.keys() == set(TEST_QUERIES)
+    for hits in results.values():
+        assert len(hits) == k
+        distances = [distance for _, _, distance in hits]
+        assert distances == sorted(distances)
+        # Each chunk is returned once, duplicates mean it was ingested twice
+        chunk_ids = {
+            (metadata.get("source_file"), metadata.get("chunk_id"))
+            for _, metadata, _ in hits
+        }
+        assert len(chunk_ids) == k
+
+
+@pytest.mark.parametrize("batch_size,k", BENCHMARK_PARAMS)
+def test_search(benchmark, vector_store, batch_size, k):
+    queries = [
+        f"{TEST_QUERIES[i % len(TEST_QUERIES)]} ({i})" for i in range(batch_size)
+    ]
+
+    def embed_and_search():
+        # Uncached, every round times the embeddings provider
+        embeddings = get_provider_embeddings().embed_documents(queries)
+        return search(normalize_embeddings(embeddings).tolist(), k)
+
+    results = benchmark.pedantic(
+        embed_and_search, rounds=BENCHMARK_ROUNDS, warmup_rounds=1
+    )
+    assert len(results) == batch_size
+    assert all(len(hits) == k for hits in results)
 
 
 if __name__ == "__main__":
-    test_vector_db()
+    asyncio.run(run_queries())
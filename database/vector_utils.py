@@ -0,0 +1,19 @@
+from typing import List
+
+import numpy as np
+
+
+def normalize_embeddings(embeddings: List[List[float]]) -> np.ndarray:
+    """Scale embeddings to unit length."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+# backend/vector_utils.py holds a copy, test_shared_copies.py checks that the
+# two behave the same
+def collection_space(collection) -> str:
+    """Distance function of a Chroma collection, fixed when it was created."""
+    # Chroma 1.x keeps it in the configuration, older versions in the metadata
+    hnsw = (getattr(collection, "configuration", None) or {}).get("hnsw") or {}
+    return hnsw.get("space") or (collection.metadata or {}).get("hnsw:space", "l2")
@@ -3,7 +3,7 @@
 import { useState } from 'react';
 import ChatInterface from '@/components/ChatInterface';
 import ChatInput from '@/components/ChatInput';
-import { sendMessage } from '@/services/api';
+import { streamMessage } from '@/services/api';
 import Image from 'next/image';
 
 export default function Home() {
@@ -28,19 +28,25 @@ export default function Home() {
     setMessages((prev) => [...prev, newMessage]);
     setIsLoading(true);
 
+    // Show the answer as it is generated, the loader until the first token
+    const aiMessageId = (Date.now() + 1).toString();
+    let hasStarted = false;
     try {
-      const response = await sendMessage(message);
-      const aiMessage = {
-        id: (Date.now() + 1).toString(),
-        content: response.answer,
-        isUser: false,
-        sources: response.sources,
-      };
-      setMessages((prev) => [...prev, aiMessage]);
+      await streamMessage(message, (chunk) => {
+        if (!hasStarted) {
+          hasStarted = true;
+          setIsLoading(false);
+          setMessages((prev) => [...prev, { id: aiMessageId, content: chunk, isUser: false }]);
+          return;
+        }
+        setMessages((prev) =>
+          prev.map((m) => (m.id === aiMessageId ? { ...m, content: m.content + chunk } : m))
+        );
+      });
     } catch (error) {
       console.error('Error sending message:', error);
       const errorMessage = {
-        id: (Date.now() + 1).toString(),
+        id: (Date.now() + 2).toString(),
         content: 'Désolé, une erreur est survenue. Veuillez réessayer.',
         isUser: false,
       };
@@ -41,4 +41,55 @@ export const sendMessage = async (message: string): Promise<ChatResponse> => {
   }
 
   return response.json();
-}; 
\ No newline at end of file
+};
+
+export const streamMessage = async (
+  message: string,
+  onChunk: (chunk: string) => void,
+): Promise<void> => {
+  const sessionId = getSessionId();
+
+  const response = await fetch(`${API_URL}/chat/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      message,
+      session_id: sessionId
+    }),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error('Failed to get response from server');
+  }
+
+  // EventSource only supports GET, so the server-sent events are read from the body
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line, the last one may be incomplete
+    const events = buffer.split('\n\n');
+    buffer = events.pop() ?? '';
+    for (const event of events) {
+      let eventType = 'message';
+      let data = '';
+      for (const line of event.split('\n')) {
+        if (line.startsWith('event: ')) eventType = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (eventType === 'error') {
+        throw new Error(JSON.parse(data));
+      }
+      if (data) {
+        onChunk(JSON.parse(data));
+      }
+    }
+  }
+};
\ No newline at end of file